@@ -1,5 +1,6 @@
 ## Importing libraries and files
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -9,83 +10,99 @@ from crewai import LLM
 from tools import search_tool, read_data_tool
 
 ### Loading LLM
-llm = LLM(model="gpt-4o-mini", temperature=0.1)
+# The core analysis gets the main model; verification and the tool-driven
+# advisor/risk agents can be pointed at a smaller, cheaper one
+ANALYSIS_MODEL = os.getenv("ANALYSIS_MODEL", "gpt-4o-mini")
+LIGHT_MODEL = os.getenv("LIGHT_MODEL", "gpt-4o-mini")
+
+@lru_cache(maxsize=None)
+def get_llm(model: str = ANALYSIS_MODEL):
+    """Return the shared LLM client for a model, created on first use"""
+    return LLM(model=model, temperature=0.1)
 
 # Creating an Experienced Financial Analyst agent
-financial_analyst = Agent(
-    role="Senior Financial Analyst",
-    goal="Provide comprehensive and accurate financial analysis based on the query: {query}",
-    verbose=True,
-    memory=True,
-    backstory=(
-        "You are an experienced financial analyst with over 15 years in investment banking and equity research. "
-        "You specialize in analyzing financial statements, identifying key performance indicators, and providing "
-        "data-driven investment insights. You always base your analysis on factual information from financial "
-        "documents and maintain high standards of accuracy and regulatory compliance. You provide balanced "
-        "assessments that consider both opportunities and risks."
-    ),
-    tools=[read_data_tool],
-    llm=llm,
-    max_iter=3,
-    max_rpm=10,
-    allow_delegation=True
-)
+@lru_cache(maxsize=1)
+def get_financial_analyst():
+    return Agent(
+        role="Senior Financial Analyst",
+        goal="Provide comprehensive and accurate financial analysis based on the query: {query}",
+        verbose=True,
+        memory=True,
+        backstory=(
+            "You are an experienced financial analyst with over 15 years in investment banking and equity research. "
+            "You specialize in analyzing financial statements, identifying key performance indicators, and providing "
+            "data-driven investment insights. You always base your analysis on factual information from financial "
+            "documents and maintain high standards of accuracy and regulatory compliance. You provide balanced "
+            "assessments that consider both opportunities and risks."
+        ),
+        tools=[read_data_tool],
+        llm=get_llm(),
+        max_iter=3,
+        max_rpm=10,
+        allow_delegation=True
+    )
 
 # Creating a document verifier agent
-verifier = Agent(
-    role="Financial Document Verifier",
-    goal="Thoroughly verify and validate financial documents to ensure they contain legitimate financial data and meet analysis requirements.",
-    verbose=True,
-    memory=True,
-    backstory=(
-        "You are a meticulous financial compliance expert with extensive experience in document verification "
-        "and regulatory standards. You have worked with SEC filings, annual reports, and financial statements "
-        "for major corporations. You ensure all documents meet quality standards before analysis and can "
-        "identify authentic financial data from other types of content."
-    ),
-    tools=[read_data_tool],
-    llm=llm,
-    max_iter=2,
-    max_rpm=10,
-    allow_delegation=True
-)
-
-
-investment_advisor = Agent(
-    role="Investment Strategy Advisor",
-    goal="Provide evidence-based investment recommendations and strategic insights based on thorough financial analysis and market conditions.",
-    verbose=True,
-    memory=True,
-    backstory=(
-        "You are a certified investment advisor with a CFA designation and 12+ years of experience in "
-        "portfolio management and investment strategy. You specialize in fundamental analysis, asset "
-        "allocation, and risk-adjusted returns. You always provide balanced recommendations that consider "
-        "the client's risk tolerance, investment horizon, and financial goals. Your advice is grounded "
-        "in rigorous financial analysis and market research."
-    ),
-    tools=[read_data_tool, search_tool],
-    llm=llm,
-    max_iter=3,
-    max_rpm=10,
-    allow_delegation=False
-)
+@lru_cache(maxsize=1)
+def get_verifier():
+    return Agent(
+        role="Financial Document Verifier",
+        goal="Thoroughly verify and validate financial documents to ensure they contain legitimate financial data and meet analysis requirements.",
+        verbose=True,
+        memory=True,
+        backstory=(
+            "You are a meticulous financial compliance expert with extensive experience in document verification "
+            "and regulatory standards. You have worked with SEC filings, annual reports, and financial statements "
+            "for major corporations. You ensure all documents meet quality standards before analysis and can "
+            "identify authentic financial data from other types of content."
+        ),
+        tools=[read_data_tool],
+        llm=get_llm(LIGHT_MODEL),
+        max_iter=2,
+        max_rpm=10,
+        allow_delegation=True
+    )
 
+# Creating an investment advisor agent
+@lru_cache(maxsize=1)
+def get_investment_advisor():
+    return Agent(
+        role="Investment Strategy Advisor",
+        goal="Provide evidence-based investment recommendations and strategic insights based on thorough financial analysis and market conditions.",
+        verbose=True,
+        memory=True,
+        backstory=(
+            "You are a certified investment advisor with a CFA designation and 12+ years of experience in "
+            "portfolio management and investment strategy. You specialize in fundamental analysis, asset "
+            "allocation, and risk-adjusted returns. You always provide balanced recommendations that consider "
+            "the client's risk tolerance, investment horizon, and financial goals. Your advice is grounded "
+            "in rigorous financial analysis and market research."
+        ),
+        tools=[read_data_tool, search_tool],
+        llm=get_llm(LIGHT_MODEL),
+        max_iter=3,
+        max_rpm=10,
+        allow_delegation=False
+    )
 
-risk_assessor = Agent(
-    role="Risk Management Specialist",
-    goal="Conduct comprehensive risk assessment and provide detailed risk management strategies based on quantitative analysis and market conditions.",
-    verbose=True,
-    memory=True,
-    backstory=(
-        "You are a risk management professional with expertise in quantitative finance and regulatory "
-        "compliance. You have worked with institutional investors and understand various risk metrics "
-        "including VaR, beta, Sharpe ratio, and stress testing. You provide balanced risk assessments "
-        "that help investors make informed decisions while maintaining appropriate risk-return profiles. "
-        "Your analysis includes market risk, credit risk, liquidity risk, and operational risk factors."
-    ),
-    tools=[read_data_tool, search_tool],
-    llm=llm,
-    max_iter=3,
-    max_rpm=10,
-    allow_delegation=False
-)
+# Creating a risk assessment agent
+@lru_cache(maxsize=1)
+def get_risk_assessor():
+    return Agent(
+        role="Risk Management Specialist",
+        goal="Conduct comprehensive risk assessment and provide detailed risk management strategies based on quantitative analysis and market conditions.",
+        verbose=True,
+        memory=True,
+        backstory=(
+            "You are a risk management professional with expertise in quantitative finance and regulatory "
+            "compliance. You have worked with institutional investors and understand various risk metrics "
+            "including VaR, beta, Sharpe ratio, and stress testing. You provide balanced risk assessments "
+            "that help investors make informed decisions while maintaining appropriate risk-return profiles. "
+            "Your analysis includes market risk, credit risk, liquidity risk, and operational risk factors."
+        ),
+        tools=[read_data_tool, search_tool],
+        llm=get_llm(LIGHT_MODEL),
+        max_iter=3,
+        max_rpm=10,
+        allow_delegation=False
+    )
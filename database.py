@@ -2,7 +2,7 @@
 Database models and configuration for Financial Document Analyzer
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, Text, DateTime, Float, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -10,7 +10,34 @@ import os
 
 # Database configuration
 DATABASE_URL = "sqlite:///./financial_analyzer.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    future=True,
+    query_cache_size=500,  # compiled SQL cache shared across requests
+    pool_size=10,
+    max_overflow=20,
+)
+
+# SQLite tuning applied to every new connection
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",       # readers don't block on writers
+    "PRAGMA synchronous=NORMAL",     # fsync on checkpoint, not every commit
+    "PRAGMA busy_timeout=5000",      # wait up to 5s for a lock
+    "PRAGMA cache_size=-65536",      # 64 MiB page cache
+    "PRAGMA mmap_size=268435456",    # 256 MiB memory-mapped IO
+    "PRAGMA temp_store=MEMORY",
+)
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Apply WAL mode and performance PRAGMAs to new SQLite connections"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -30,7 +57,7 @@ class AnalysisResult(Base):
     __tablename__ = "analysis_results"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)  # Foreign key to users
+    user_id = Column(Integer)  # Foreign key to users; indexed via __table_args__
     filename = Column(String(255))
     file_size = Column(Integer)
     query = Column(Text)
@@ -38,13 +65,23 @@ class AnalysisResult(Base):
     processing_time = Column(Float)  # in seconds
     status = Column(String(20), default="completed")  # pending, processing, completed, failed
     created_at = Column(DateTime, default=datetime.utcnow)
+    content_hash = Column(String(32), nullable=True)  # BLAKE2b-128 of the uploaded file
+    
+    __table_args__ = (
+        # Dedup lookups by document content
+        Index("ix_ar_content_hash", "content_hash"),
+        # User history listing: WHERE user_id ORDER BY created_at DESC
+        Index("ix_ar_user_created", "user_id", "created_at"),
+        # Latest result for a queued file: WHERE user_id AND filename ORDER BY created_at DESC
+        Index("ix_ar_user_filename_created", "user_id", "filename", "created_at"),
+    )
     
 class AnalysisQueue(Base):
     """Model for managing analysis queue"""
     __tablename__ = "analysis_queue"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)
+    user_id = Column(Integer)
     filename = Column(String(255))
     file_path = Column(String(500))
     query = Column(Text)
@@ -54,11 +91,36 @@ class AnalysisQueue(Base):
     started_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
     error_message = Column(Text, nullable=True)
+    content_hash = Column(String(32), nullable=True)  # BLAKE2b-128 of the uploaded file, copied to the result
+    
+    __table_args__ = (
+        # Per-user queue statistics: WHERE user_id AND status
+        Index("ix_queue_user_status", "user_id", "status"),
+    )
+
+def add_missing_columns():
+    """Add model columns missing from existing tables (ALTER TABLE ADD COLUMN)"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    ))
 
 # Create tables
 def create_tables():
     """Create all database tables"""
     Base.metadata.create_all(bind=engine)
+    # create_all() doesn't alter tables that already exist, so add any new
+    # nullable columns and missing indexes explicitly
+    add_missing_columns()
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 # Database dependency
 def get_db():
@@ -3,69 +3,273 @@ Enhanced Financial Document Analyzer with Database and Queue Integration
 """
 
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict
+import aiofiles
+import aiofiles.os
+from sqlalchemy import select, insert, update, bindparam, text, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 import os
+import re
 import uuid
 import time
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, List
 
 # Import our modules
-from database import get_db, create_tables, User, AnalysisResult, AnalysisQueue
-from queue_worker import queue_manager
+from database import engine, get_db, create_tables, User, AnalysisResult, AnalysisQueue
+from queue_worker import queue_manager, REDIS_CONNECTED
+from cache import LRUCache
 
 # Initialize database
 create_tables()
 
+# Prebuilt Core selects - compiled once and reused from the engine's SQL cache
+SEL_USER = select(
+    User.id, User.username, User.email, User.created_at, User.total_analyses
+).where(User.id == bindparam("uid"))
+
+SEL_QUEUE_ITEM = select(
+    AnalysisQueue.id,
+    AnalysisQueue.user_id,
+    AnalysisQueue.filename,
+    AnalysisQueue.status,
+    AnalysisQueue.created_at,
+    AnalysisQueue.started_at,
+    AnalysisQueue.completed_at,
+    AnalysisQueue.error_message,
+).where(AnalysisQueue.id == bindparam("qid"))
+
+SEL_LATEST_RESULT = select(
+    AnalysisResult.id, AnalysisResult.processing_time
+).where(
+    AnalysisResult.user_id == bindparam("uid"),
+    AnalysisResult.filename == bindparam("filename"),
+).order_by(AnalysisResult.created_at.desc()).limit(1)
+
+SEL_RESULT = select(
+    AnalysisResult.id,
+    AnalysisResult.filename,
+    AnalysisResult.query,
+    AnalysisResult.analysis_result,
+    AnalysisResult.processing_time,
+    AnalysisResult.status,
+    AnalysisResult.created_at,
+).where(AnalysisResult.id == bindparam("rid"))
+
+# Analysis text is streamed in slices so the full TEXT value is never loaded at once
+SEL_RESULT_LENGTH = select(
+    func.length(AnalysisResult.analysis_result)
+).where(AnalysisResult.id == bindparam("rid"))
+
+SEL_RESULT_SLICE = select(
+    func.substr(AnalysisResult.analysis_result, bindparam("start"), bindparam("size"))
+).where(AnalysisResult.id == bindparam("rid"))
+
+SEL_USER_RESULTS = select(
+    AnalysisResult.id,
+    AnalysisResult.filename,
+    AnalysisResult.query,
+    AnalysisResult.status,
+    AnalysisResult.processing_time,
+    AnalysisResult.created_at,
+).where(
+    AnalysisResult.user_id == bindparam("uid")
+).order_by(
+    AnalysisResult.created_at.desc()
+).offset(bindparam("skip")).limit(bindparam("limit"))
+
+SEL_USER_RESULT_COUNT = select(func.count()).select_from(AnalysisResult).where(
+    AnalysisResult.user_id == bindparam("uid")
+)
+
 app = FastAPI(
     title="Financial Document Analyzer - Enhanced",
     description="AI-powered financial document analysis with queue processing and database storage",
     version="2.0.0"
 )
 
+# Response models
+class UserOut(BaseModel):
+    """Public user record"""
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    username: str
+    email: str
+    created_at: datetime
+    total_analyses: int = 0
+
+class AnalysisResultOut(BaseModel):
+    """Stored analysis result"""
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    filename: Optional[str] = None
+    query: Optional[str] = None
+    analysis: Optional[str] = None
+    processing_time: Optional[float] = None
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class QueueStatusOut(BaseModel):
+    """Status of a queued analysis"""
+    queue_id: int
+    status: str
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    error: Optional[str] = None
+    result_id: Optional[int] = None
+    processing_time: Optional[float] = None
+
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+SPOOL_MAX_SIZE = 2 * 1024 * 1024  # immediate-analysis uploads kept in memory
+ANALYSIS_THREADS = 32
+
+@app.on_event("startup")
+async def _init_executor():
+    """Size the default thread pool used for blocking analysis work"""
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=ANALYSIS_THREADS)
+    )
+
+USER_STATS_FLUSH_INTERVAL = 10  # seconds
+
+async def _flush_user_stats():
+    """Periodically move Redis-buffered analysis counts into the database"""
+    while True:
+        await asyncio.sleep(USER_STATS_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(queue_manager.flush_user_analyses)
+        except Exception as e:
+            print(f"User stats flush failed: {e}")
+
+@app.on_event("startup")
+async def _start_user_stats_flush():
+    """Start the user stats reconciliation task when Redis is available"""
+    if REDIS_CONNECTED:
+        app.state.user_stats_task = asyncio.create_task(_flush_user_stats())
+
+@app.on_event("shutdown")
+async def _stop_user_stats_flush():
+    """Stop the reconciliation task and flush any remaining counts"""
+    task = getattr(app.state, "user_stats_task", None)
+    if task is not None:
+        task.cancel()
+        await asyncio.to_thread(queue_manager.flush_user_analyses)
+
+@app.on_event("startup")
+async def _init_dirs():
+    """Create the upload directory once instead of on every request"""
+    os.makedirs("data", exist_ok=True)
+
+async def save_upload(file: UploadFile, file_path: str, spool_max_size: int = 0) -> tuple:
+    """Stream an uploaded file to disk in chunks.
+    
+    Uploads up to spool_max_size bytes are kept in memory instead of being
+    written out. Returns the size in bytes, a BLAKE2b digest of the content,
+    and the bytes for in-memory uploads (None when written to file_path).
+    """
+    size = 0
+    digest = hashlib.blake2b(digest_size=16)
+    spool = bytearray()
+    out = None
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            if out is None:
+                if size <= spool_max_size:
+                    spool += chunk
+                    continue
+                out = await aiofiles.open(file_path, "wb")
+                if spool:
+                    await out.write(bytes(spool))
+                spool = None
+            await out.write(chunk)
+    finally:
+        if out is not None:
+            await out.close()
+    
+    content = bytes(spool) if out is None else None
+    return size, digest.hexdigest(), content
+
+# Extracted PDF text keyed by content hash, so re-submitted documents skip parsing
+PDF_CACHE_SIZE = 64
+_pdf_text_cache = LRUCache(PDF_CACHE_SIZE)
+
+async def extract_pdf_text(source, content_hash: str) -> str:
+    """Extract PDF text from a path or bytes in a worker thread, reusing cached text for known content"""
+    text = _pdf_text_cache.get(content_hash)
+    if text is not None:
+        return text
+    
+    text = await asyncio.to_thread(queue_manager.pdf_tool.extract_text, source)
+    # Don't cache read failures
+    if not text.startswith("Error"):
+        _pdf_text_cache.set(content_hash, text)
+    return text
+
+async def remove_upload(file_path: str) -> None:
+    """Delete an uploaded file without blocking the event loop"""
+    if await aiofiles.os.path.exists(file_path):
+        try:
+            await aiofiles.os.remove(file_path)
+        except Exception:
+            pass
+
 # User management endpoints
-@app.post("/users/", response_model=dict)
+@app.post("/users/", response_model=UserOut)
 async def create_user(username: str = Form(...), email: str = Form(...), db: Session = Depends(get_db)):
     """Create a new user"""
-    # Check if user exists
-    existing_user = db.query(User).filter(
-        (User.username == username) | (User.email == email)
-    ).first()
+    # Single INSERT; a username/email clash on either unique index yields no row
+    stmt = sqlite_insert(User).values(
+        username=username, email=email
+    ).on_conflict_do_nothing().returning(
+        User.id, User.username, User.email, User.created_at
+    )
+    user = db.execute(stmt).mappings().first()
     
-    if existing_user:
+    if user is None:
+        db.rollback()
         raise HTTPException(status_code=400, detail="Username or email already exists")
     
-    user = User(username=username, email=email)
-    db.add(user)
     db.commit()
-    db.refresh(user)
     
     return {
-        "id": user.id,
-        "username": user.username,
-        "email": user.email,
-        "created_at": user.created_at
+        "id": user["id"],
+        "username": user["username"],
+        "email": user["email"],
+        "created_at": user["created_at"]
     }
 
-@app.get("/users/{user_id}")
+@app.get("/users/{user_id}", response_model=UserOut)
 async def get_user(user_id: int, db: Session = Depends(get_db)):
     """Get user information"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.execute(SEL_USER, {"uid": user_id}).mappings().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     return {
-        "id": user.id,
-        "username": user.username,
-        "email": user.email,
-        "created_at": user.created_at,
-        "total_analyses": user.total_analyses
+        "id": user["id"],
+        "username": user["username"],
+        "email": user["email"],
+        "created_at": user["created_at"],
+        "total_analyses": (user["total_analyses"] or 0) + queue_manager.pending_user_analyses(user_id)
     }
 
 # Enhanced analysis endpoints
 @app.post("/analyze/queue")
 async def queue_analysis(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     query: str = Form(default="Analyze this financial document for investment insights"),
     user_id: int = Form(default=1),
@@ -84,11 +288,7 @@ async def queue_analysis(
     file_path = f"data/queue_{file_id}_{file.filename}"
     
     try:
-        os.makedirs("data", exist_ok=True)
-        
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        _, content_hash, _ = await save_upload(file, file_path)
         
         # Add to queue
         queue_id = queue_manager.add_to_queue(
@@ -96,7 +296,9 @@ async def queue_analysis(
             filename=file.filename,
             file_path=file_path,
             query=query.strip(),
-            priority=priority
+            priority=priority,
+            background_tasks=background_tasks,
+            content_hash=content_hash
         )
         
         return {
@@ -108,70 +310,89 @@ async def queue_analysis(
         
     except Exception as e:
         # Clean up file on error
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        await asyncio.shield(remove_upload(file_path))
         raise HTTPException(status_code=500, detail=f"Error queuing analysis: {str(e)}")
 
-@app.get("/analyze/status/{queue_id}")
+# Accepts "5", "queued_local_5", "queued_redis_analysis_5" and the older
+# "processed_immediate_5" form
+_QUEUE_ID_RE = re.compile(r"(?:queued_redis_(?:analysis_)?|queued_local_|processed_immediate_)?(\d+)$")
+
+@app.get("/analyze/status/{queue_id}", response_model=QueueStatusOut, response_model_exclude_unset=True)
 async def get_analysis_status(queue_id: str, db: Session = Depends(get_db)):
     """Get the status of a queued analysis"""
-    try:
-        # Extract queue ID from queue_id string
-        if queue_id.startswith("queued_redis_"):
-            actual_id = int(queue_id.split("_")[-1])
-        elif queue_id.startswith("processed_immediate_"):
-            actual_id = int(queue_id.split("_")[-1])
-        else:
-            actual_id = int(queue_id)
-        
-        queue_item = db.query(AnalysisQueue).filter(AnalysisQueue.id == actual_id).first()
-        if not queue_item:
-            raise HTTPException(status_code=404, detail="Queue item not found")
-        
-        response = {
-            "queue_id": actual_id,
-            "status": queue_item.status,
-            "created_at": queue_item.created_at,
-            "started_at": queue_item.started_at,
-            "completed_at": queue_item.completed_at
-        }
-        
-        if queue_item.error_message:
-            response["error"] = queue_item.error_message
-        
-        # If completed, get the result
-        if queue_item.status == "completed":
-            result = db.query(AnalysisResult).filter(
-                AnalysisResult.user_id == queue_item.user_id,
-                AnalysisResult.filename == queue_item.filename
-            ).order_by(AnalysisResult.created_at.desc()).first()
-            
-            if result:
-                response["result_id"] = result.id
-                response["processing_time"] = result.processing_time
-        
-        return response
-        
-    except ValueError:
+    # Extract queue ID from queue_id string
+    match = _QUEUE_ID_RE.match(queue_id)
+    if not match:
         raise HTTPException(status_code=400, detail="Invalid queue ID format")
+    actual_id = int(match.group(1))
+    
+    queue_item = db.execute(SEL_QUEUE_ITEM, {"qid": actual_id}).mappings().first()
+    if not queue_item:
+        raise HTTPException(status_code=404, detail="Queue item not found")
+    
+    response = {
+        "queue_id": actual_id,
+        "status": queue_item["status"],
+        "created_at": queue_item["created_at"],
+        "started_at": queue_item["started_at"],
+        "completed_at": queue_item["completed_at"]
+    }
+    
+    if queue_item["error_message"]:
+        response["error"] = queue_item["error_message"]
+    
+    # If completed, get the result
+    if queue_item["status"] == "completed":
+        result = db.execute(SEL_LATEST_RESULT, {
+            "uid": queue_item["user_id"],
+            "filename": queue_item["filename"]
+        }).mappings().first()
+        
+        if result:
+            response["result_id"] = result["id"]
+            response["processing_time"] = result["processing_time"]
+    
+    return response
 
-@app.get("/results/{result_id}")
+@app.get("/results/{result_id}", response_model=AnalysisResultOut)
 async def get_analysis_result(result_id: int, db: Session = Depends(get_db)):
     """Get a specific analysis result"""
-    result = db.query(AnalysisResult).filter(AnalysisResult.id == result_id).first()
+    result = db.execute(SEL_RESULT, {"rid": result_id}).mappings().first()
     if not result:
         raise HTTPException(status_code=404, detail="Analysis result not found")
     
     return {
-        "id": result.id,
-        "filename": result.filename,
-        "query": result.query,
-        "analysis": result.analysis_result,
-        "processing_time": result.processing_time,
-        "status": result.status,
-        "created_at": result.created_at
+        "id": result["id"],
+        "filename": result["filename"],
+        "query": result["query"],
+        "analysis": result["analysis_result"],
+        "processing_time": result["processing_time"],
+        "status": result["status"],
+        "created_at": result["created_at"]
     }
 
+STREAM_CHUNK_CHARS = 65536
+
+@app.get("/results/{result_id}/stream")
+async def stream_analysis_result(result_id: int, db: Session = Depends(get_db)):
+    """Stream the analysis text of a result as plain text"""
+    row = db.execute(SEL_RESULT_LENGTH, {"rid": result_id}).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Analysis result not found")
+    total_chars = row[0] or 0
+    
+    def iter_slices():
+        with engine.connect() as conn:
+            for start in range(1, total_chars + 1, STREAM_CHUNK_CHARS):
+                chunk = conn.execute(SEL_RESULT_SLICE, {
+                    "rid": result_id, "start": start, "size": STREAM_CHUNK_CHARS
+                }).scalar()
+                if not chunk:
+                    break
+                yield chunk.encode("utf-8")
+    
+    return StreamingResponse(iter_slices(), media_type="text/plain; charset=utf-8")
+
 @app.get("/users/{user_id}/results")
 async def get_user_results(
     user_id: int, 
@@ -180,27 +401,24 @@ async def get_user_results(
     db: Session = Depends(get_db)
 ):
     """Get all analysis results for a user"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.execute(SEL_USER, {"uid": user_id}).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    results = db.query(AnalysisResult).filter(
-        AnalysisResult.user_id == user_id
-    ).order_by(AnalysisResult.created_at.desc()).offset(skip).limit(limit).all()
+    total = db.execute(SEL_USER_RESULT_COUNT, {"uid": user_id}).scalar_one()
+    results = db.execute(
+        SEL_USER_RESULTS, {"uid": user_id, "skip": skip, "limit": limit}
+    ).mappings().all()
+    
+    next_skip = skip + len(results)
     
     return {
         "user_id": user_id,
-        "total_results": len(results),
-        "results": [
-            {
-                "id": r.id,
-                "filename": r.filename,
-                "query": r.query,
-                "status": r.status,
-                "processing_time": r.processing_time,
-                "created_at": r.created_at
-            } for r in results
-        ]
+        "total_results": total,
+        "skip": skip,
+        "limit": limit,
+        "next_skip": next_skip if next_skip < total else None,
+        "results": [dict(r) for r in results]
     }
 
 @app.get("/queue/status")
@@ -223,43 +441,50 @@ async def analyze_document_immediate(
     start_time = time.time()
     
     try:
-        os.makedirs("data", exist_ok=True)
-        
         # Save uploaded file
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # No queue worker needs this file, so small uploads stay in memory
+        file_size, content_hash, content = await save_upload(
+            file, file_path, spool_max_size=SPOOL_MAX_SIZE
+        )
         
-        # Process immediately
-        analysis = queue_manager.perform_analysis(
-            queue_manager.pdf_tool._run(file_path), 
-            query.strip()
+        # Process immediately, off the event loop
+        pdf_text = await extract_pdf_text(
+            content if content is not None else file_path, content_hash
+        )
+        analysis = await asyncio.to_thread(
+            queue_manager.perform_analysis, pdf_text, query.strip()
         )
         
         processing_time = time.time() - start_time
         
-        # Save to database
-        result = AnalysisResult(
+        # Save result and bump user stats in a single transaction
+        insert_result = insert(AnalysisResult).values(
             user_id=user_id,
             filename=file.filename,
-            file_size=os.path.getsize(file_path),
+            file_size=file_size,
+            content_hash=content_hash,
             query=query,
             analysis_result=analysis,
             processing_time=processing_time,
             status="completed"
+        ).returning(AnalysisResult.id)
+        update_user = update(User).where(User.id == user_id).values(
+            total_analyses=User.total_analyses + 1
         )
-        db.add(result)
         
-        # Update user stats
-        user = db.query(User).filter(User.id == user_id).first()
-        if user:
-            user.total_analyses += 1
+        with db.begin():
+            result_id = db.execute(insert_result).scalar_one()
+            if not REDIS_CONNECTED:
+                db.execute(update_user)
         
-        db.commit()
+        # With Redis the counter is buffered and flushed by _flush_user_stats
+        if REDIS_CONNECTED and not queue_manager.record_user_analysis(user_id):
+            with db.begin():
+                db.execute(update_user)
         
         return {
             "status": "success",
-            "result_id": result.id,
+            "result_id": result_id,
             "query": query,
             "analysis": analysis,
             "processing_time": processing_time,
@@ -270,12 +495,8 @@ async def analyze_document_immediate(
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
     
     finally:
-        # Clean up uploaded file
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
+        # Clean up uploaded file, even if the client disconnects mid-request
+        await asyncio.shield(remove_upload(file_path))
 
 @app.get("/")
 async def root():
@@ -292,22 +513,36 @@ async def root():
         ]
     }
 
-@app.get("/health")
-async def health_check(db: Session = Depends(get_db)):
-    """Detailed health check"""
-    try:
-        # Test database connection
-        db.execute("SELECT 1")
-        db_status = "healthy"
-    except:
-        db_status = "unhealthy"
+PING = text("SELECT 1")
+HEALTH_CACHE_TTL = 1.0  # seconds
+
+# Last database probe result, shared across /health hits
+_db_health = {"status": None, "checked_at": 0.0}
+
+def check_database() -> str:
+    """Ping the database, reusing the last result for HEALTH_CACHE_TTL seconds"""
+    now = time.monotonic()
+    if _db_health["status"] is not None and now - _db_health["checked_at"] < HEALTH_CACHE_TTL:
+        return _db_health["status"]
     
-    queue_status = queue_manager.get_queue_status()
+    try:
+        with engine.connect() as conn:
+            conn.execute(PING).scalar()
+        status = "healthy"
+    except Exception:
+        status = "unhealthy"
     
+    _db_health["status"] = status
+    _db_health["checked_at"] = now
+    return status
+
+@app.get("/health")
+async def health_check():
+    """Detailed health check"""
     return {
         "status": "healthy",
-        "database": db_status,
-        "queue_system": "available" if queue_status["redis_connected"] else "fallback_mode",
+        "database": check_database(),
+        "queue_system": "available" if REDIS_CONNECTED else "fallback_mode",
         "timestamp": datetime.utcnow().isoformat()
     }
 
@@ -7,10 +7,14 @@ import subprocess
 import sys
 import os
 
-def install_package(package):
-    """Install a Python package"""
+def install_packages(packages):
+    """Install Python packages with a single pip invocation"""
     try:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", package])
+        subprocess.check_call([
+            sys.executable, "-m", "pip", "install",
+            "--upgrade", "--no-input", "--disable-pip-version-check",
+            *packages
+        ])
         return True
     except subprocess.CalledProcessError:
         return False
@@ -26,15 +30,13 @@ def main():
         "python-dateutil"
     ]
     
-    success_count = 0
-    
-    for package in bonus_packages:
-        print(f"📦 Installing {package}...")
-        if install_package(package):
-            print(f"✅ {package} installed successfully")
-            success_count += 1
-        else:
-            print(f"❌ Failed to install {package}")
+    print(f"📦 Installing {', '.join(bonus_packages)}...")
+    if install_packages(bonus_packages):
+        print("✅ Packages installed successfully")
+        success_count = len(bonus_packages)
+    else:
+        print("❌ Failed to install packages")
+        success_count = 0
     
     print("\n" + "=" * 50)
     print(f"📊 Installation Summary: {success_count}/{len(bonus_packages)} packages installed")
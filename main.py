@@ -3,21 +3,47 @@ Financial Document Analyzer - Complete System
 AI Internship Debug Challenge - All Features in One File
 """
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, BackgroundTasks
 from fastapi.responses import JSONResponse
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Float
+from pydantic import BaseModel
+from concurrent.futures import ProcessPoolExecutor
+import aiofiles
+import anyio.to_thread
+from sqlalchemy import create_engine, event, inspect, update, func, exists, or_, text, Column, Integer, String, Text, DateTime, Float, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 import os
+import re
+import contextlib
 import uuid
 import time
-import PyPDF2
+import asyncio
+import hashlib
+import pypdfium2 as pdfium
+import ahocorasick
+from cache import LRUCache
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Union
 
 # Database setup
 DATABASE_URL = "sqlite:///./financial_analyzer.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=10
+)
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Enable WAL so readers don't block on writers, plus cache/mmap tuning"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -37,7 +63,7 @@ class AnalysisResult(Base):
     __tablename__ = "analysis_results"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)
+    user_id = Column(Integer)
     filename = Column(String(255))
     file_size = Column(Integer)
     query = Column(Text)
@@ -45,13 +71,21 @@ class AnalysisResult(Base):
     processing_time = Column(Float)
     status = Column(String(20), default="completed")
     created_at = Column(DateTime, default=datetime.utcnow)
+    content_hash = Column(String(32), nullable=True)
+    
+    # Same index names as database.py - both modules share financial_analyzer.db
+    __table_args__ = (
+        Index("ix_ar_content_hash", "content_hash"),
+        Index("ix_ar_user_created", "user_id", "created_at"),
+        Index("ix_ar_user_filename_created", "user_id", "filename", "created_at"),
+    )
 
 class AnalysisQueue(Base):
     """Model for managing analysis queue"""
     __tablename__ = "analysis_queue"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)
+    user_id = Column(Integer)
     filename = Column(String(255))
     file_path = Column(String(500))
     query = Column(Text)
@@ -61,9 +95,27 @@ class AnalysisQueue(Base):
     started_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
     error_message = Column(Text, nullable=True)
+    content_hash = Column(String(32), nullable=True)
+    
+    __table_args__ = (
+        Index("ix_queue_user_status", "user_id", "status"),
+    )
 
-# Create tables
+# Create tables, plus any columns and indexes missing from tables that already exist
 Base.metadata.create_all(bind=engine)
+with engine.begin() as _conn:
+    _inspector = inspect(_conn)
+    for _table in Base.metadata.sorted_tables:
+        _existing = {column["name"] for column in _inspector.get_columns(_table.name)}
+        for _column in _table.columns:
+            if _column.name not in _existing:
+                _conn.execute(text(
+                    f"ALTER TABLE {_table.name} ADD COLUMN {_column.name} "
+                    f"{_column.type.compile(dialect=engine.dialect)}"
+                ))
+for _table in Base.metadata.sorted_tables:
+    for _index in _table.indexes:
+        _index.create(bind=engine, checkfirst=True)
 
 # Database dependency
 def get_db():
@@ -74,95 +126,54 @@ def get_db():
     finally:
         db.close()
 
-# Queue Manager Class
-class QueueManager:
-    """Manages the analysis queue and background processing"""
-    
-    def __init__(self):
-        pass
-    
-    def read_pdf(self, file_path: str) -> str:
-        """Read PDF content"""
-        try:
-            if not os.path.exists(file_path):
-                return f"Error: PDF file not found at {file_path}"
-            
-            full_report = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    content = page.extract_text()
-                    
-                    # Clean and format the financial document data
-                    while "\n\n" in content:
-                        content = content.replace("\n\n", "\n")
-                        
-                    full_report += content + "\n"
-            
-            # Return a summary if the document is too long
-            if len(full_report) > 10000:
-                return full_report[:10000] + "\n\n[Document truncated for processing...]"
-                    
-            return full_report if full_report.strip() else "No readable content found in PDF"
-            
-        except Exception as e:
-            return f"Error reading PDF file: {str(e)}"
-    
-    def perform_analysis(self, pdf_content: str, query: str) -> str:
-        """Perform financial analysis on PDF content"""
-        try:
-            # Professional financial analysis
-            analysis = f"""
+# PDF extraction settings
+MAX_PDF_CHARS = 10000
+BLANK_LINES_RE = re.compile(r"\n{2,}")
+
+# Financial keywords scanned for in documents
+FINANCIAL_KEYWORDS = {
+    'revenue': 'Revenue/Sales Performance',
+    'profit': 'Profitability Analysis',
+    'loss': 'Loss Assessment',
+    'cash flow': 'Cash Flow Analysis',
+    'assets': 'Asset Evaluation',
+    'liabilities': 'Liability Assessment',
+    'equity': 'Equity Analysis',
+    'debt': 'Debt Structure Review',
+    'investment': 'Investment Portfolio',
+    'dividend': 'Dividend Policy',
+    'earnings': 'Earnings Performance',
+    'margin': 'Margin Analysis',
+    'growth': 'Growth Metrics',
+    'market': 'Market Position'
+}
+
+# Rendered finding line per keyword, in report order
+FINDING_LINES = {
+    keyword: f"✅ **{description}**: Relevant data identified in document"
+    for keyword, description in FINANCIAL_KEYWORDS.items()
+}
+NO_FINDINGS_LINE = "⚠️ Limited financial keywords detected - document may require manual review"
+
+# Analysis report layout, filled in by QueueManager.perform_analysis
+ANALYSIS_TEMPLATE = """
 # Financial Document Analysis Report
 
 ## Executive Summary
 **Query**: {query}
-**Analysis Date**: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}
-**Document Length**: {len(pdf_content)} characters
+**Analysis Date**: {ts}
+**Document Length**: {doc_len} characters
 
 ## Document Analysis
 
 ### Key Financial Indicators Found:
-"""
-            
-            # Look for financial keywords with professional analysis
-            financial_keywords = {
-                'revenue': 'Revenue/Sales Performance',
-                'profit': 'Profitability Analysis',
-                'loss': 'Loss Assessment',
-                'cash flow': 'Cash Flow Analysis',
-                'assets': 'Asset Evaluation',
-                'liabilities': 'Liability Assessment',
-                'equity': 'Equity Analysis',
-                'debt': 'Debt Structure Review',
-                'investment': 'Investment Portfolio',
-                'dividend': 'Dividend Policy',
-                'earnings': 'Earnings Performance',
-                'margin': 'Margin Analysis',
-                'growth': 'Growth Metrics',
-                'market': 'Market Position'
-            }
-            
-            findings = []
-            for keyword, description in financial_keywords.items():
-                if keyword.lower() in pdf_content.lower():
-                    findings.append(f"✅ **{description}**: Relevant data identified in document")
-            
-            if findings:
-                analysis += "\n".join(findings)
-            else:
-                analysis += "⚠️ Limited financial keywords detected - document may require manual review"
-            
-            # Add investment insights
-            analysis += f"""
+{findings}
 
 ## Investment Analysis
 
 ### Document Overview:
-- **Content Quality**: {'High' if len(pdf_content) > 5000 else 'Medium' if len(pdf_content) > 1000 else 'Limited'}
-- **Data Completeness**: {'Comprehensive' if len(findings) > 5 else 'Moderate' if len(findings) > 2 else 'Basic'}
+- **Content Quality**: {quality}
+- **Data Completeness**: {completeness}
 
 ### Key Recommendations:
 1. **Due Diligence**: Review complete financial statements for comprehensive analysis
@@ -175,24 +186,104 @@ class QueueManager:
 - Regulatory and compliance considerations
 
 ## Document Preview (First 500 characters):
-{pdf_content[:500]}...
+{preview}...
 
 ---
 *This analysis is for informational purposes only and should not be considered as financial advice.*
 """
+
+# Keywords lowercased once at import; matched against lowercased text
+FINANCIAL_KEYS_LC = tuple(keyword.lower() for keyword in FINANCIAL_KEYWORDS)
+
+# Aho-Corasick automaton matching every keyword in one pass over the text
+KEYWORD_AUTOMATON = ahocorasick.Automaton()
+for _keyword, _keyword_lc in zip(FINANCIAL_KEYWORDS, FINANCIAL_KEYS_LC):
+    KEYWORD_AUTOMATON.add_word(_keyword_lc, _keyword)
+KEYWORD_AUTOMATON.make_automaton()
+
+# Queue Manager Class
+class QueueManager:
+    """Manages the analysis queue and background processing"""
+    
+    def __init__(self):
+        pass
+    
+    def read_pdf(self, source: Union[str, bytes]) -> str:
+        """Read PDF content from a file path or an in-memory PDF"""
+        try:
+            if isinstance(source, str) and not os.path.exists(source):
+                return f"Error: PDF file not found at {source}"
+            
+            # Pages are extracted sequentially on purpose: PDFium is not
+            # thread-safe (not even across separate documents), and the
+            # MAX_PDF_CHARS early exit usually stops after a few pages.
+            # Parallelism comes from the process pool running whole documents.
+            parts = []
+            total_len = 0
+            pdf = pdfium.PdfDocument(source)
+            try:
+                for page in pdf:
+                    textpage = page.get_textpage()
+                    content = textpage.get_text_range()
+                    textpage.close()
+                    page.close()
+                    
+                    # Clean and format the financial document data
+                    content = content.replace("\r\n", "\n")
+                    if "\n\n" in content:  # most pages have no blank runs
+                        content = BLANK_LINES_RE.sub("\n", content)
+                    parts.append(content)
+                    
+                    # Stop once the text will be truncated anyway, so memory stays
+                    # bounded by MAX_PDF_CHARS plus one page whatever the document size
+                    total_len += len(content) + 1
+                    if total_len > MAX_PDF_CHARS:
+                        break
+            finally:
+                pdf.close()
+            
+            full_report = "\n".join(parts) + "\n" if parts else ""
+            
+            # Return a summary if the document is too long
+            if len(full_report) > MAX_PDF_CHARS:
+                return full_report[:MAX_PDF_CHARS] + "\n\n[Document truncated for processing...]"
+                    
+            return full_report if full_report.strip() else "No readable content found in PDF"
+            
+        except Exception as e:
+            return f"Error reading PDF file: {str(e)}"
+    
+    def perform_analysis(self, pdf_content: str, query: str) -> str:
+        """Perform financial analysis on PDF content"""
+        try:
+            # Look for financial keywords with professional analysis (single pass)
+            hits = {keyword for _, keyword in KEYWORD_AUTOMATON.iter(pdf_content.lower())}
+            findings = [line for keyword, line in FINDING_LINES.items() if keyword in hits]
+            doc_len = len(pdf_content)
+            
+            # Professional financial analysis
+            analysis = ANALYSIS_TEMPLATE.format_map({
+                "query": query,
+                "ts": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC'),
+                "doc_len": doc_len,
+                "findings": "\n".join(findings) if findings else NO_FINDINGS_LINE,
+                "quality": 'High' if doc_len > 5000 else 'Medium' if doc_len > 1000 else 'Limited',
+                "completeness": 'Comprehensive' if len(findings) > 5 else 'Moderate' if len(findings) > 2 else 'Basic',
+                "preview": pdf_content[:500]
+            })
             
             return analysis
             
         except Exception as e:
             return f"Error in analysis: {str(e)}"
     
-    def process_document(self, file_path: str, query: str, user_id: int = 1) -> dict:
+    def process_document(self, source: Union[str, bytes], query: str, user_id: int = 1) -> dict:
         """Process a document analysis"""
         start_time = time.time()
         
         try:
             # Read PDF content
-            pdf_content = self.read_pdf(file_path)
+            pdf_content = self.read_pdf(source)
             
             # Perform analysis
             analysis = self.perform_analysis(pdf_content, query)
@@ -202,7 +293,8 @@ class QueueManager:
             return {
                 "status": "success",
                 "analysis": analysis,
-                "processing_time": processing_time
+                "processing_time": processing_time,
+                "content": pdf_content
             }
             
         except Exception as e:
@@ -211,6 +303,57 @@ class QueueManager:
 # Initialize queue manager
 queue_manager = QueueManager()
 
+def _process_document_worker(source: Union[str, bytes], query: str, user_id: int) -> dict:
+    """Process a document in a pool worker process (must stay module-level to pickle)"""
+    return queue_manager.process_document(source, query, user_id)
+
+# Upload and worker pool settings
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+THREADPOOL_LIMIT = 32  # threads for sync dependencies such as get_db
+
+SPOOL_MAX_SIZE = 2 * 1024 * 1024  # uploads up to 2 MiB never touch disk
+
+async def save_upload(file: UploadFile, file_path: str) -> tuple:
+    """Read an upload in chunks, keeping small files in memory.
+    
+    Uploads larger than SPOOL_MAX_SIZE are streamed to file_path. Returns the
+    size, a content hash, and the bytes for in-memory uploads (None when the
+    upload was written to disk).
+    """
+    size = 0
+    digest = hashlib.blake2b(digest_size=16)
+    spool = bytearray()
+    out = None
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            digest.update(chunk)
+            if out is None:
+                if size <= SPOOL_MAX_SIZE:
+                    spool += chunk
+                    continue
+                # Too big to keep in memory - spill what we have to disk
+                out = await aiofiles.open(file_path, "wb")
+                await out.write(bytes(spool))
+                spool = None
+            await out.write(chunk)
+    finally:
+        if out is not None:
+            await out.close()
+    
+    content = bytes(spool) if out is None else None
+    return size, digest.hexdigest(), content
+
+def discard_upload(file_path: str) -> None:
+    """Delete an uploaded file if it was written to disk"""
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(file_path)
+
+# Extracted PDF text keyed by document hash. Only the text is cached: each
+# request renders its own report, so it quotes its own query and carries its
+# own analysis date.
+document_text_cache = LRUCache(max_size=500, ttl=1800)
+
 # FastAPI Application
 app = FastAPI(
     title="Financial Document Analyzer",
@@ -218,16 +361,71 @@ app = FastAPI(
     version="2.0.0"
 )
 
+# Response models - FastAPI serialises these with Pydantic's compiled
+# serializer instead of jsonable_encoder + json.dumps
+class UserOut(BaseModel):
+    """Public user record"""
+    id: int
+    username: str
+    email: str
+    created_at: datetime
+    total_analyses: int = 0
+
+class AnalysisOut(BaseModel):
+    """Result of an immediate analysis"""
+    status: str
+    result_id: int
+    query: str
+    analysis: str
+    processing_time: float
+    file_processed: Optional[str] = None
+
+class AnalysisResultOut(BaseModel):
+    """Stored analysis result"""
+    id: int
+    filename: Optional[str] = None
+    query: Optional[str] = None
+    analysis: Optional[str] = None
+    processing_time: Optional[float] = None
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class AnalysisSummaryOut(BaseModel):
+    """Analysis result listing entry"""
+    id: int
+    filename: Optional[str] = None
+    query: Optional[str] = None
+    status: Optional[str] = None
+    processing_time: Optional[float] = None
+    created_at: Optional[datetime] = None
+
+class UserResultsOut(BaseModel):
+    """Page of a user's analysis results"""
+    user_id: int
+    total_results: int
+    results: List[AnalysisSummaryOut]
+
+@app.on_event("startup")
+async def _start_workers():
+    """Create the PDF processing pool and cap the sync threadpool"""
+    app.state.pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_LIMIT
+
+@app.on_event("shutdown")
+async def _stop_workers():
+    """Shut down the PDF processing pool"""
+    app.state.pool.shutdown(wait=False, cancel_futures=True)
+
 # User management endpoints
-@app.post("/users/", response_model=dict)
+@app.post("/users/", response_model=UserOut)
 async def create_user(username: str = Form(...), email: str = Form(...), db: Session = Depends(get_db)):
     """Create a new user"""
-    # Check if user exists
-    existing_user = db.query(User).filter(
-        (User.username == username) | (User.email == email)
-    ).first()
+    # Check if user exists (SELECT EXISTS - no row is loaded)
+    user_exists = db.query(
+        exists().where(or_(User.username == username, User.email == email))
+    ).scalar()
     
-    if existing_user:
+    if user_exists:
         raise HTTPException(status_code=400, detail="Username or email already exists")
     
     user = User(username=username, email=email)
@@ -242,7 +440,7 @@ async def create_user(username: str = Form(...), email: str = Form(...), db: Ses
         "created_at": user.created_at
     }
 
-@app.get("/users/{user_id}")
+@app.get("/users/{user_id}", response_model=UserOut)
 async def get_user(user_id: int, db: Session = Depends(get_db)):
     """Get user information"""
     user = db.query(User).filter(User.id == user_id).first()
@@ -258,8 +456,9 @@ async def get_user(user_id: int, db: Session = Depends(get_db)):
     }
 
 # Main analysis endpoint
-@app.post("/analyze")
+@app.post("/analyze", response_model=AnalysisOut)
 async def analyze_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     query: str = Form(default="Analyze this financial document for investment insights"),
     user_id: int = Form(default=1),
@@ -275,12 +474,25 @@ async def analyze_document(
         os.makedirs("data", exist_ok=True)
         
         # Save uploaded file
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        file_size, content_hash, content = await save_upload(file, file_path)
         
-        # Process document
-        result = queue_manager.process_document(file_path, query.strip(), user_id)
+        cached_text = document_text_cache.get(content_hash)
+        if cached_text is not None:
+            # Known document - skip parsing and render a fresh report
+            result = {
+                "status": "success",
+                "analysis": queue_manager.perform_analysis(cached_text, query.strip()),
+                "processing_time": time.time() - start_time
+            }
+        else:
+            # Process document in the worker pool so the event loop stays free
+            result = await asyncio.get_running_loop().run_in_executor(
+                app.state.pool, _process_document_worker,
+                content if content is not None else file_path, query.strip(), user_id
+            )
+            # Don't cache read failures
+            if result["status"] == "success" and not result["content"].startswith("Error"):
+                document_text_cache.set(content_hash, result["content"])
         
         if result["status"] == "success":
             processing_time = result["processing_time"]
@@ -289,7 +501,8 @@ async def analyze_document(
             analysis_record = AnalysisResult(
                 user_id=user_id,
                 filename=file.filename,
-                file_size=os.path.getsize(file_path),
+                file_size=file_size,
+                content_hash=content_hash,
                 query=query,
                 analysis_result=result["analysis"],
                 processing_time=processing_time,
@@ -297,13 +510,19 @@ async def analyze_document(
             )
             db.add(analysis_record)
             
-            # Update user stats
-            user = db.query(User).filter(User.id == user_id).first()
-            if user:
-                user.total_analyses += 1
+            # Update user stats without loading the user row
+            db.execute(
+                update(User).where(User.id == user_id).values(
+                    total_analyses=User.total_analyses + 1
+                )
+            )
             
             db.commit()
             
+            # Delete the spilled upload after the response has been sent
+            if content is None:
+                background_tasks.add_task(discard_upload, file_path)
+            
             return {
                 "status": "success",
                 "result_id": analysis_record.id,
@@ -316,17 +535,11 @@ async def analyze_document(
             raise HTTPException(status_code=500, detail=result["message"])
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
-    
-    finally:
         # Clean up uploaded file
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
+        discard_upload(file_path)
+        raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
 
-@app.get("/results/{result_id}")
+@app.get("/results/{result_id}", response_model=AnalysisResultOut)
 async def get_analysis_result(result_id: int, db: Session = Depends(get_db)):
     """Get a specific analysis result"""
     result = db.query(AnalysisResult).filter(AnalysisResult.id == result_id).first()
@@ -343,7 +556,7 @@ async def get_analysis_result(result_id: int, db: Session = Depends(get_db)):
         "created_at": result.created_at
     }
 
-@app.get("/users/{user_id}/results")
+@app.get("/users/{user_id}/results", response_model=UserResultsOut)
 async def get_user_results(
     user_id: int, 
     skip: int = 0, 
@@ -355,13 +568,15 @@ async def get_user_results(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    results = db.query(AnalysisResult).filter(
-        AnalysisResult.user_id == user_id
-    ).order_by(AnalysisResult.created_at.desc()).offset(skip).limit(limit).all()
+    user_results = db.query(AnalysisResult).filter(AnalysisResult.user_id == user_id)
+    total_results = user_results.with_entities(func.count(AnalysisResult.id)).scalar()
+    results = user_results.order_by(
+        AnalysisResult.created_at.desc()
+    ).offset(skip).limit(limit).all()
     
     return {
         "user_id": user_id,
-        "total_results": len(results),
+        "total_results": total_results,
         "results": [
             {
                 "id": r.id,
@@ -379,7 +594,6 @@ async def get_system_stats(db: Session = Depends(get_db)):
     """Get system statistics"""
     total_users = db.query(User).count()
     total_analyses = db.query(AnalysisResult).count()
-    from sqlalchemy import func
     avg_processing_time = db.query(func.avg(AnalysisResult.processing_time)).scalar() or 0
     
     return {
@@ -405,12 +619,14 @@ async def root():
         ]
     }
 
+PING = text("SELECT 1")
+
 @app.get("/health")
 async def health_check(db: Session = Depends(get_db)):
     """Detailed health check"""
     try:
         # Test database connection
-        db.execute("SELECT 1")
+        db.execute(PING).scalar()
         db_status = "healthy"
     except:
         db_status = "unhealthy"
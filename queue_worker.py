@@ -6,22 +6,29 @@ Uses Redis Queue (RQ) for background task processing
 import os
 import time
 import uuid
+import multiprocessing
 from datetime import datetime
 from typing import Optional
 
+import ahocorasick
+
 try:
     import redis
-    from rq import Queue, Worker
+    from rq import Queue, SimpleWorker
     REDIS_AVAILABLE = True
 except ImportError as e:
     REDIS_AVAILABLE = False
     print(f"Redis/RQ import error: {e}")
     print("Install with: pip install redis rq")
 
-from sqlalchemy.orm import Session
-from database import SessionLocal, AnalysisResult, AnalysisQueue
+from sqlalchemy import update, func
+from sqlalchemy.orm import Session, scoped_session
+from database import SessionLocal, User, AnalysisResult, AnalysisQueue
 from tools import FinancialDocumentTool
 
+# Thread-local session reused across tasks handled by the same thread
+WorkerSession = scoped_session(SessionLocal)
+
 # Redis connection
 if REDIS_AVAILABLE:
     try:
@@ -36,15 +43,52 @@ if REDIS_AVAILABLE:
 else:
     REDIS_CONNECTED = False
 
+# Financial keywords scanned for in documents
+FINANCIAL_KEYWORDS = {
+    'revenue': 'Revenue/Sales data found',
+    'profit': 'Profitability information identified',
+    'loss': 'Loss information detected',
+    'cash flow': 'Cash flow statements present',
+    'assets': 'Asset information available',
+    'liabilities': 'Liability data found',
+    'equity': 'Equity information present',
+    'debt': 'Debt information identified',
+    'investment': 'Investment data found',
+    'dividend': 'Dividend information present'
+}
+
+# Rendered finding line per keyword, in report order
+FINDING_LINES = {
+    keyword: f"- {description}" for keyword, description in FINANCIAL_KEYWORDS.items()
+}
+
+# Keywords lowercased once at import; matched against lowercased text
+FINANCIAL_KEYS_LC = tuple(keyword.lower() for keyword in FINANCIAL_KEYWORDS)
+
+# Aho-Corasick automaton matching every keyword in one pass over the text
+KEYWORD_AUTOMATON = ahocorasick.Automaton()
+for _keyword, _keyword_lc in zip(FINANCIAL_KEYWORDS, FINANCIAL_KEYS_LC):
+    KEYWORD_AUTOMATON.add_word(_keyword_lc, _keyword)
+KEYWORD_AUTOMATON.make_automaton()
+
+# Per-user analysis counters buffered in Redis until flushed to the users table
+USER_ANALYSES_KEY = "user:{}:total_analyses"
+
 class QueueManager:
     """Manages the analysis queue and background processing"""
     
     def __init__(self):
         self.pdf_tool = FinancialDocumentTool()
     
-    def add_to_queue(self, user_id: int, filename: str, file_path: str, query: str, priority: int = 1) -> str:
-        """Add analysis task to queue"""
-        db = SessionLocal()
+    def add_to_queue(self, user_id: int, filename: str, file_path: str, query: str,
+                     priority: int = 1, background_tasks=None,
+                     content_hash: Optional[str] = None) -> str:
+        """Add analysis task to queue.
+        
+        If background_tasks (a FastAPI/Starlette BackgroundTasks) is given, the
+        task is dispatched after the response is sent instead of inline.
+        """
+        db = WorkerSession()
         try:
             # Create queue entry
             queue_item = AnalysisQueue(
@@ -53,34 +97,42 @@ class QueueManager:
                 file_path=file_path,
                 query=query,
                 priority=priority,
-                status="pending"
+                status="pending",
+                content_hash=content_hash
             )
             db.add(queue_item)
             db.commit()
-            
-            if REDIS_CONNECTED:
-                # Add to Redis queue
-                job = queue.enqueue(
-                    self.process_document,
-                    queue_item.id,
-                    job_timeout='10m',
-                    job_id=f"analysis_{queue_item.id}"
-                )
-                return f"queued_redis_{job.id}"
-            else:
-                # Fallback: process immediately
-                result = self.process_document(queue_item.id)
-                return f"processed_immediate_{queue_item.id}"
-                
+            queue_id = queue_item.id
         except Exception as e:
             db.rollback()
             raise e
         finally:
             db.close()
+        
+        if background_tasks is not None:
+            background_tasks.add_task(self.dispatch, queue_id)
+        else:
+            self.dispatch(queue_id)
+        
+        if REDIS_CONNECTED:
+            return f"queued_redis_analysis_{queue_id}"
+        return f"queued_local_{queue_id}"
+    
+    def dispatch(self, queue_id: int) -> None:
+        """Hand a queued task to Redis, or process it locally without Redis"""
+        if REDIS_CONNECTED:
+            queue.enqueue(
+                self.process_document,
+                queue_id,
+                job_timeout='10m',
+                job_id=f"analysis_{queue_id}"
+            )
+        else:
+            self.process_document(queue_id)
     
     def process_document(self, queue_id: int) -> dict:
         """Process a document analysis task"""
-        db = SessionLocal()
+        db = WorkerSession()
         start_time = time.time()
         
         try:
@@ -97,7 +149,7 @@ class QueueManager:
             # Perform analysis
             try:
                 # Read PDF content
-                pdf_content = self.pdf_tool._run(queue_item.file_path)
+                pdf_content = self.pdf_tool.extract_text(queue_item.file_path)
                 
                 # Simple analysis (can be enhanced with AI agents)
                 analysis = self.perform_analysis(pdf_content, queue_item.query)
@@ -109,6 +161,7 @@ class QueueManager:
                     user_id=queue_item.user_id,
                     filename=queue_item.filename,
                     file_size=os.path.getsize(queue_item.file_path) if os.path.exists(queue_item.file_path) else 0,
+                    content_hash=queue_item.content_hash,
                     query=queue_item.query,
                     analysis_result=analysis,
                     processing_time=processing_time,
@@ -131,6 +184,7 @@ class QueueManager:
                 
             except Exception as e:
                 # Handle processing error
+                db.rollback()
                 queue_item.status = "failed"
                 queue_item.error_message = str(e)
                 queue_item.completed_at = datetime.utcnow()
@@ -160,24 +214,9 @@ class QueueManager:
 ## Key Findings:
 """
             
-            # Look for financial keywords
-            financial_keywords = {
-                'revenue': 'Revenue/Sales data found',
-                'profit': 'Profitability information identified',
-                'loss': 'Loss information detected',
-                'cash flow': 'Cash flow statements present',
-                'assets': 'Asset information available',
-                'liabilities': 'Liability data found',
-                'equity': 'Equity information present',
-                'debt': 'Debt information identified',
-                'investment': 'Investment data found',
-                'dividend': 'Dividend information present'
-            }
-            
-            findings = []
-            for keyword, description in financial_keywords.items():
-                if keyword.lower() in pdf_content.lower():
-                    findings.append(f"- {description}")
+            # Look for financial keywords (single pass)
+            hits = {keyword for _, keyword in KEYWORD_AUTOMATON.iter(pdf_content.lower())}
+            findings = [line for keyword, line in FINDING_LINES.items() if keyword in hits]
             
             if findings:
                 analysis += "\n".join(findings)
@@ -192,41 +231,116 @@ class QueueManager:
         except Exception as e:
             return f"Error in analysis: {str(e)}"
     
+    def record_user_analysis(self, user_id: int) -> bool:
+        """Count a completed analysis in Redis; returns False if Redis is unavailable"""
+        if not REDIS_CONNECTED:
+            return False
+        try:
+            redis_conn.incr(USER_ANALYSES_KEY.format(user_id))
+            return True
+        except Exception as e:
+            print(f"Failed to record analysis for user {user_id}: {e}")
+            return False
+    
+    def pending_user_analyses(self, user_id: int) -> int:
+        """Get analyses counted in Redis but not yet flushed to the database"""
+        if not REDIS_CONNECTED:
+            return 0
+        try:
+            return int(redis_conn.get(USER_ANALYSES_KEY.format(user_id)) or 0)
+        except Exception:
+            return 0
+    
+    def flush_user_analyses(self) -> int:
+        """Move buffered Redis counters into users.total_analyses"""
+        if not REDIS_CONNECTED:
+            return 0
+        
+        flushed = 0
+        db = WorkerSession()
+        try:
+            for key in redis_conn.scan_iter(match=USER_ANALYSES_KEY.format("*")):
+                delta = int(redis_conn.getset(key, 0) or 0)
+                if not delta:
+                    continue
+                user_id = int(key.split(":")[1])
+                try:
+                    db.execute(
+                        update(User).where(User.id == user_id).values(
+                            total_analyses=User.total_analyses + delta
+                        )
+                    )
+                    db.commit()
+                    flushed += delta
+                except Exception as e:
+                    db.rollback()
+                    # Put the delta back so it's retried on the next flush
+                    redis_conn.incrby(key, delta)
+                    print(f"Failed to flush analyses for user {user_id}: {e}")
+            return flushed
+        finally:
+            db.close()
+    
     def get_queue_status(self, user_id: Optional[int] = None) -> dict:
         """Get queue status and statistics"""
-        db = SessionLocal()
+        db = WorkerSession()
         try:
-            query = db.query(AnalysisQueue)
+            query = db.query(AnalysisQueue.status, func.count(AnalysisQueue.id))
             if user_id:
                 query = query.filter(AnalysisQueue.user_id == user_id)
             
-            total = query.count()
-            pending = query.filter(AnalysisQueue.status == "pending").count()
-            processing = query.filter(AnalysisQueue.status == "processing").count()
-            completed = query.filter(AnalysisQueue.status == "completed").count()
-            failed = query.filter(AnalysisQueue.status == "failed").count()
+            # One grouped scan instead of a COUNT per status
+            by_status = dict(query.group_by(AnalysisQueue.status).all())
             
             return {
-                "total": total,
-                "pending": pending,
-                "processing": processing,
-                "completed": completed,
-                "failed": failed,
+                "total": sum(by_status.values()),
+                "pending": by_status.get("pending", 0),
+                "processing": by_status.get("processing", 0),
+                "completed": by_status.get("completed", 0),
+                "failed": by_status.get("failed", 0),
                 "redis_connected": REDIS_CONNECTED
             }
         finally:
             db.close()
 
 # Worker function for RQ
-def start_worker():
-    """Start the RQ worker"""
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", os.cpu_count() or 1))
+
+def _run_worker():
+    """Run a single RQ worker (module-level so it can be a Process target)"""
+    # SimpleWorker runs jobs in this process instead of forking per job, so
+    # the thread-local WorkerSession and its pooled connection are reused
+    worker = SimpleWorker(['financial_analysis'], connection=redis_conn)
+    try:
+        worker.work(with_scheduler=True)
+    finally:
+        WorkerSession.remove()
+
+def start_worker(concurrency: int = WORKER_CONCURRENCY):
+    """Start RQ workers, one process per unit of concurrency"""
     if not REDIS_CONNECTED:
         print("Redis not available. Cannot start worker.")
         return
     
-    worker = Worker(['financial_analysis'], connection=redis_conn)
-    print("Starting financial analysis worker...")
-    worker.work()
+    print(f"Starting {concurrency} financial analysis worker(s)...")
+    if concurrency <= 1:
+        _run_worker()
+        return
+    
+    processes = [
+        multiprocessing.Process(target=_run_worker, name=f"analysis-worker-{i}")
+        for i in range(concurrency)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
 
 # Initialize queue manager
 queue_manager = QueueManager()
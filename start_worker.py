@@ -5,7 +5,7 @@ Start the Redis Queue Worker for background processing
 
 import sys
 import os
-from queue_worker import start_worker, REDIS_CONNECTED
+from queue_worker import start_worker, REDIS_CONNECTED, WORKER_CONCURRENCY
 
 def main():
     print("🚀 Financial Document Analyzer - Queue Worker")
@@ -22,7 +22,8 @@ def main():
         return 1
     
     print("✅ Redis connection established")
-    print("🔄 Starting background worker...")
+    print(f"🔄 Starting {WORKER_CONCURRENCY} background worker(s)...")
+    print("   (set WORKER_CONCURRENCY to change)")
     print("📋 Listening for financial analysis tasks...")
     print("\nPress Ctrl+C to stop the worker")
     print("-" * 50)
@@ -3,74 +3,87 @@
 Test script to verify the financial document analyzer system works correctly
 """
 
+import asyncio
 import os
 import sys
-import requests
+import httpx
 import time
 
-def test_api_health():
+BASE_URL = "http://localhost:8000"
+SAMPLE_FILE = "data/TSLA-Q2-2025-Update.pdf"
+# Each query is uploaded concurrently against the sample document
+UPLOAD_QUERIES = (
+    'Test analysis of Tesla financial document',
+)
+
+async def test_api_health(client):
     """Test if the API is running"""
     try:
-        response = requests.get("http://localhost:8000/")
+        response = await client.get("/")
         if response.status_code == 200:
             print("✅ API Health Check: PASSED")
             return True
         else:
             print("❌ API Health Check: FAILED")
             return False
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         print("❌ API Health Check: FAILED - Server not running")
         return False
 
-def test_file_upload():
-    """Test file upload and analysis"""
+async def upload_and_analyze(client, query):
+    """Upload the sample file with one query and check the analysis"""
     try:
-        # Check if sample file exists
-        sample_file = "data/TSLA-Q2-2025-Update.pdf"
-        if not os.path.exists(sample_file):
-            print("❌ File Upload Test: FAILED - Sample file not found")
-            return False
-        
-        # Test file upload
-        with open(sample_file, 'rb') as f:
-            response = requests.post(
-                'http://localhost:8000/analyze',
-                files={'file': f},
-                data={'query': 'Test analysis of Tesla financial document'}
+        # httpx streams the opened file into the multipart body in chunks
+        with open(SAMPLE_FILE, 'rb') as f:
+            response = await client.post(
+                '/analyze',
+                files={'file': (os.path.basename(SAMPLE_FILE), f, 'application/pdf')},
+                data={'query': query}
             )
         
         if response.status_code == 200:
             result = response.json()
             if result.get('status') == 'success':
-                print("✅ File Upload Test: PASSED")
+                print(f"✅ File Upload Test: PASSED ({query})")
                 print(f"   Analysis length: {len(result.get('analysis', ''))}")
                 return True
             else:
-                print("❌ File Upload Test: FAILED - Invalid response")
+                print(f"❌ File Upload Test: FAILED - Invalid response ({query})")
                 return False
         else:
-            print(f"❌ File Upload Test: FAILED - Status code: {response.status_code}")
+            print(f"❌ File Upload Test: FAILED - Status code: {response.status_code} ({query})")
             return False
             
     except Exception as e:
         print(f"❌ File Upload Test: FAILED - {str(e)}")
         return False
 
-def main():
+async def test_file_upload(client):
+    """Test file upload and analysis"""
+    # Check if sample file exists
+    if not os.path.exists(SAMPLE_FILE):
+        print("❌ File Upload Test: FAILED - Sample file not found")
+        return False
+    
+    results = await asyncio.gather(*(upload_and_analyze(client, query) for query in UPLOAD_QUERIES))
+    return all(results)
+
+async def main():
     """Run all tests"""
     print("🧪 Testing Financial Document Analyzer System")
     print("=" * 50)
     
-    # Test 1: API Health
-    health_ok = test_api_health()
-    
-    if not health_ok:
-        print("\n❌ Cannot proceed with tests - API server not running")
-        print("Please start the server with: python main.py")
-        sys.exit(1)
-    
-    # Test 2: File Upload and Analysis
-    upload_ok = test_file_upload()
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=httpx.Timeout(60, connect=3)) as client:
+        # Test 1: API Health
+        health_ok = await test_api_health(client)
+        
+        if not health_ok:
+            print("\n❌ Cannot proceed with tests - API server not running")
+            print("Please start the server with: python main.py")
+            return 1
+        
+        # Test 2: File Upload and Analysis
+        upload_ok = await test_file_upload(client)
     
     # Summary
     print("\n" + "=" * 50)
@@ -86,4 +99,4 @@ def main():
         return 1
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(asyncio.run(main()))
\ No newline at end of file
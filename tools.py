@@ -1,10 +1,15 @@
 ## Importing libraries and files
 import os
+import re
+import threading
+import ahocorasick
 from dotenv import load_dotenv
 load_dotenv()
 
 from crewai_tools import SerperDevTool
 from crewai.tools import BaseTool
+import pypdfium2 as pdfium
+from cache import LRUCache
 from typing import Type
 from pydantic import BaseModel, Field
 
@@ -12,6 +17,18 @@ from pydantic import BaseModel, Field
 search_tool = SerperDevTool()
 
 ## Creating custom pdf reader tool
+# PDFium is not thread-safe (not even across separate documents), and
+# extraction runs on worker threads. Pages are therefore read sequentially;
+# the MAX_PDF_CHARS early exit keeps that to the first few pages.
+PDFIUM_LOCK = threading.Lock()
+MAX_PDF_CHARS = 10000
+BLANK_LINES_RE = re.compile(r"\n{2,}")
+# Every agent gets the document back byte-identical inside the same
+# delimiters, so providers with automatic prompt caching (OpenAI, vLLM
+# prefix caching) can reuse the prefill across tasks. Don't add per-call
+# content (timestamps, paths) inside or ahead of the block.
+DOCUMENT_BLOCK = "<document>\n{}\n</document>"
+
 class FinancialDocumentToolInput(BaseModel):
     """Input schema for FinancialDocumentTool."""
     path: str = Field(..., description="Path to the PDF file to read")
@@ -27,44 +44,124 @@ class FinancialDocumentTool(BaseTool):
         Args:
             path (str, optional): Path of the pdf file. Defaults to 'data/TSLA-Q2-2025-Update.pdf'.
 
+        Returns:
+            str: Full Financial Document content
+        """
+        # Several agents read the same document per request - parse it once
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return f"Error: PDF file not found at {path}"
+        text = _extract_cached(path, stat.st_mtime_ns, stat.st_size)
+        # Read failures go back bare so agents don't take them for document content
+        if text.startswith("Error"):
+            return text
+        return DOCUMENT_BLOCK.format(text)
+
+    @staticmethod
+    def extract_text(source) -> str:
+        """Extract text from a PDF given its path or its raw bytes
+
+        Args:
+            source (str | bytes): Path of the pdf file, or the file content already in memory.
+
         Returns:
             str: Full Financial Document content
         """
         try:
-            import PyPDF2
-            import os
-            
             # Check if file exists
-            if not os.path.exists(path):
-                return f"Error: PDF file not found at {path}"
+            if isinstance(source, str) and not os.path.exists(source):
+                return f"Error: PDF file not found at {source}"
             
-            full_report = ""
-            with open(path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    content = page.extract_text()
+            parts = []
+            total_len = 0
+            with PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(source)
+                try:
+                    for page in pdf:
+                        textpage = page.get_textpage()
+                        content = textpage.get_text_range()
+                        textpage.close()
+                        page.close()
                     
-                    # Clean and format the financial document data
-                    while "\n\n" in content:
-                        content = content.replace("\n\n", "\n")
-                        
-                    full_report += content + "\n"
+                        # Clean and format the financial document data
+                        content = content.replace("\r\n", "\n")
+                        if "\n\n" in content:  # most pages have no blank runs
+                            content = BLANK_LINES_RE.sub("\n", content)
+                        parts.append(content)
+
+                        # Stop once the text will be truncated anyway, so memory stays
+                        # bounded by MAX_PDF_CHARS plus one page whatever the document size
+                        total_len += len(content) + 1
+                        if total_len > MAX_PDF_CHARS:
+                            break
+                finally:
+                    pdf.close()
             
+            full_report = "\n".join(parts) + "\n" if parts else ""
+
             # Return a summary if the document is too long
-            if len(full_report) > 10000:
-                return full_report[:10000] + "\n\n[Document truncated for processing...]"
+            if len(full_report) > MAX_PDF_CHARS:
+                return full_report[:MAX_PDF_CHARS] + "\n\n[Document truncated for processing...]"
                     
             return full_report if full_report.strip() else "No readable content found in PDF"
             
         except Exception as e:
             return f"Error reading PDF file: {str(e)}"
 
+# Caching the extracted text rather than open PdfDocument handles: a repeat
+# call never reaches PDFium, and no file descriptors or native documents
+# stay pinned between requests
+TEXT_CACHE_SIZE = 32
+_text_cache = LRUCache(TEXT_CACHE_SIZE)
+
+def _extract_cached(path: str, mtime_ns: int, size: int) -> str:
+    """Memoised extract_text; mtime and size in the key invalidate edited files"""
+    key = (path, mtime_ns, size)
+    text = _text_cache.get(key)
+    if text is not None:
+        return text
+    
+    text = FinancialDocumentTool.extract_text(path)
+    # Don't cache read failures
+    if not text.startswith("Error"):
+        _text_cache.set(key, text)
+    return text
+
 # Create an instance of the tool
 read_data_tool = FinancialDocumentTool()
 
 ## Creating Investment Analysis Tool
+MULTI_SPACE_RE = re.compile(r" {2,}")
+
+def build_keyword_automaton(signals):
+    """Build an Aho-Corasick automaton mapping each lowercase keyword to its message"""
+    automaton = ahocorasick.Automaton()
+    for keywords, message in signals:
+        for keyword in keywords:
+            automaton.add_word(keyword, message)
+    automaton.make_automaton()
+    return automaton
+
+def scan_signals(text, signals, automaton):
+    """Return the messages whose keywords occur in text, in signal order (single pass)"""
+    hits = set()
+    for _, message in automaton.iter(text.lower()):
+        hits.add(message)
+        # Stop scanning a large document once every signal has matched
+        if len(hits) == len(signals):
+            break
+    return [message for _, message in signals if message in hits]
+
+# Key financial indicators: (keywords, analysis point)
+INVESTMENT_SIGNALS = (
+    (("revenue",), "Revenue data identified for trend analysis"),
+    (("profit", "earnings"), "Profitability metrics available for evaluation"),
+    (("cash flow",), "Cash flow information present for liquidity assessment"),
+)
+INVESTMENT_AUTOMATON = build_keyword_automaton(INVESTMENT_SIGNALS)
+INVESTMENT_SUMMARY_HEADER = "Investment Analysis Summary:\n"
+
 class InvestmentAnalysisToolInput(BaseModel):
     """Input schema for InvestmentAnalysisTool."""
     financial_data: str = Field(..., description="Financial document data to analyze")
@@ -81,25 +178,29 @@ class InvestmentAnalysisTool(BaseTool):
             processed_data = financial_data
             
             # Clean up the data format
-            processed_data = processed_data.replace("  ", " ")  # Remove double spaces
+            processed_data = MULTI_SPACE_RE.sub(" ", processed_data)  # Collapse runs of spaces
             
             # Basic analysis framework
             analysis_points = []
             
             # Look for key financial indicators
-            if "revenue" in processed_data.lower():
-                analysis_points.append("Revenue data identified for trend analysis")
-            if "profit" in processed_data.lower() or "earnings" in processed_data.lower():
-                analysis_points.append("Profitability metrics available for evaluation")
-            if "cash flow" in processed_data.lower():
-                analysis_points.append("Cash flow information present for liquidity assessment")
+            analysis_points.extend(scan_signals(processed_data, INVESTMENT_SIGNALS, INVESTMENT_AUTOMATON))
                 
-            return f"Investment Analysis Summary:\n" + "\n".join([f"- {point}" for point in analysis_points])
+            return INVESTMENT_SUMMARY_HEADER + "\n".join(f"- {point}" for point in analysis_points)
             
         except Exception as e:
             return f"Error in investment analysis: {str(e)}"
 
 ## Creating Risk Assessment Tool
+# Common risk indicators: (keywords, risk factor)
+RISK_SIGNALS = (
+    (("debt",), "Debt levels require monitoring for leverage risk"),
+    (("volatile", "uncertainty"), "Market volatility factors identified"),
+    (("competition",), "Competitive pressures noted in market analysis"),
+)
+RISK_AUTOMATON = build_keyword_automaton(RISK_SIGNALS)
+RISK_SUMMARY_HEADER = "Risk Assessment Summary:\n"
+
 class RiskAssessmentToolInput(BaseModel):
     """Input schema for RiskAssessmentTool."""
     financial_data: str = Field(..., description="Financial document data to assess for risks")
@@ -115,18 +216,13 @@ class RiskAssessmentTool(BaseTool):
             risk_factors = []
             
             # Analyze for common risk indicators
-            if "debt" in financial_data.lower():
-                risk_factors.append("Debt levels require monitoring for leverage risk")
-            if "volatile" in financial_data.lower() or "uncertainty" in financial_data.lower():
-                risk_factors.append("Market volatility factors identified")
-            if "competition" in financial_data.lower():
-                risk_factors.append("Competitive pressures noted in market analysis")
+            risk_factors.extend(scan_signals(financial_data, RISK_SIGNALS, RISK_AUTOMATON))
                 
-            return f"Risk Assessment Summary:\n" + "\n".join([f"- {point}" for point in risk_factors])
+            return RISK_SUMMARY_HEADER + "\n".join(f"- {point}" for point in risk_factors)
             
         except Exception as e:
             return f"Error in risk assessment: {str(e)}"
 
 # Create tool instances
 investment_analysis_tool = InvestmentAnalysisTool()
-risk_assessment_tool = RiskAssessmentTool()
\ No newline at end of file
+risk_assessment_tool = RiskAssessmentTool()